@@ -14,7 +14,9 @@ if not os.getenv("RUNNING_IN_PRODUCTION"):
     reload = True
 
 num_cpus = multiprocessing.cpu_count()
-workers = (num_cpus * 2) + 1
+workers = int(os.getenv("WEB_CONCURRENCY", (num_cpus * 2) + 1))
+# Let workers know how many siblings share the CPUs, so OpenCV can size its thread pool
+os.environ["WEB_CONCURRENCY"] = str(workers)
 worker_class = "uvicorn.workers.UvicornWorker"
 
 timeout = 120
@@ -18,5 +18,7 @@ def create_app():
     from . import chat  # noqa
 
     app.register_blueprint(chat.bp)
+    # Raise Quart's 16 MB default, so video uploads up to the handler's own limit can be received
+    app.config["MAX_CONTENT_LENGTH"] = chat.MAX_REQUEST_SIZE
 
     return app
@@ -1,11 +1,17 @@
-import io
-import json
+import asyncio
+import hashlib
 import os
 import tempfile
+from collections import deque
+from collections.abc import AsyncIterator
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Optional
 
+import httpx
+import orjson
 from azure.identity.aio import AzureDeveloperCliCredential, ManagedIdentityCredential, get_bearer_token_provider
-from openai import AsyncOpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from quart import (
     Blueprint,
     Response,
@@ -14,31 +20,48 @@ from quart import (
     request,
     stream_with_context,
 )
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.sansio.multipart import Data, Event, File, MultipartDecoder, NeedData
 from werkzeug.utils import secure_filename
 
-from .video_handler import AzureBlobStorageHandler, VideoProcessor
+from .video_handler import AzureBlobStorageHandler, BlobVideoUpload, FrameCache, VideoProcessor
 
 bp = Blueprint("chat", __name__, template_folder="templates", static_folder="static")
 
 # Video processing configuration
 MAX_VIDEO_SIZE_MB = 2048  # 2 GB
+# Largest request body accepted: the largest allowed video plus the multipart form around it
+MAX_REQUEST_SIZE = (MAX_VIDEO_SIZE_MB + 1) * 1024 * 1024
 ALLOWED_VIDEO_EXTENSIONS = {'.mp4'}
 ALLOWED_IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg'}
+FRAME_UPLOAD_CONCURRENCY = 8
+# Uploaded video bytes are written and hashed off the event loop in blocks of this size
+RECEIVE_BLOCK_SIZE = 1024 * 1024  # 1 MiB
 
 
 @bp.before_app_serving
 async def configure_openai():
     bp.model_name = os.getenv("OPENAI_MODEL", "gpt-4o")
     openai_host = os.getenv("OPENAI_HOST", "github")
+    # Share one HTTP/2 connection pool across requests, so concurrent chat streams multiplex over it
+    http_client = DefaultAsyncHttpxClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    )
 
     if openai_host == "local":
-        bp.openai_client = AsyncOpenAI(api_key="no-key-required", base_url=os.getenv("LOCAL_OPENAI_ENDPOINT"))
+        bp.openai_client = AsyncOpenAI(
+            api_key="no-key-required",
+            base_url=os.getenv("LOCAL_OPENAI_ENDPOINT"),
+            http_client=http_client,
+        )
         current_app.logger.info("Using local OpenAI-compatible API service with no key")
     elif openai_host == "github":
         bp.model_name = f"openai/{bp.model_name}"
         bp.openai_client = AsyncOpenAI(
             api_key=os.environ["GITHUB_TOKEN"],
             base_url="https://models.github.ai/inference",
+            http_client=http_client,
         )
         current_app.logger.info("Using GitHub models with GITHUB_TOKEN as key")
     elif os.getenv("AZURE_OPENAI_KEY_FOR_CHATVISION"):
@@ -48,6 +71,7 @@ async def configure_openai():
         bp.openai_client = AsyncOpenAI(
             base_url=os.environ["AZURE_OPENAI_ENDPOINT"],
             api_key=os.getenv("AZURE_OPENAI_KEY_FOR_CHATVISION"),
+            http_client=http_client,
         )
         current_app.logger.info("Using Azure OpenAI with key")
     elif os.getenv("RUNNING_IN_PRODUCTION"):
@@ -57,6 +81,7 @@ async def configure_openai():
         bp.openai_client = AsyncOpenAI(
             base_url=os.environ["AZURE_OPENAI_ENDPOINT"] + "/openai/v1/",
             api_key=token_provider,
+            http_client=http_client,
         )
         current_app.logger.info("Using Azure OpenAI with managed identity credential for client ID %s", client_id)
     else:
@@ -66,12 +91,27 @@ async def configure_openai():
         bp.openai_client = AsyncOpenAI(
             base_url=os.environ["AZURE_OPENAI_ENDPOINT"] + "/openai/v1/",
             api_key=token_provider,
+            http_client=http_client,
         )
         current_app.logger.info("Using Azure OpenAI with az CLI credential for tenant ID: %s", tenant_id)
     current_app.logger.info("Using model %s", bp.model_name)
 
-    # Initialize video handler
-    bp.video_processor = VideoProcessor(fps=float(os.getenv("VIDEO_EXTRACT_FPS", "1.0")))
+    # Initialize video handler, with its own workers so extractions don't starve other blocking tasks
+    bp.video_executor = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="video")
+    # Capability detection runs ffmpeg probes, which would otherwise block the event loop
+    bp.video_processor = await asyncio.to_thread(
+        VideoProcessor,
+        fps=float(os.getenv("VIDEO_EXTRACT_FPS", "1.0")),
+        max_dimension=int(os.getenv("MAX_FRAME_DIMENSION", "768")),
+        hwaccel=os.getenv("VIDEO_HWACCEL", "auto"),
+        scene_threshold=float(os.getenv("VIDEO_SCENE_THRESHOLD", "0.3")),
+        dedup_distance=int(os.getenv("VIDEO_DEDUP_DISTANCE", "4")),
+        executor=bp.video_executor,
+    )
+    bp.frame_cache = FrameCache(
+        os.getenv("VIDEO_FRAME_CACHE_DIR", os.path.join(tempfile.gettempdir(), "semanticvideos-frames")),
+        max_bytes=int(os.getenv("VIDEO_FRAME_CACHE_MB", "512")) * 1024 * 1024,
+    )
     bp.blob_storage = AzureBlobStorageHandler()
     if os.getenv("AZURE_STORAGE_ACCOUNT_URL"):
         await bp.blob_storage.initialize()
@@ -83,6 +123,8 @@ async def shutdown_openai():
     await bp.openai_client.close()
     if hasattr(bp, 'blob_storage'):
         await bp.blob_storage.close()
+    if hasattr(bp, 'video_executor'):
+        bp.video_executor.shutdown(wait=False, cancel_futures=True)
 
 
 @bp.get("/")
@@ -90,83 +132,250 @@ async def index():
     return await render_template("index.html")
 
 
+async def get_video_frames(video_path: str, digest: str) -> AsyncIterator[str]:
+    """Reuse frames from an earlier upload of the same video, otherwise extract and cache them."""
+    cache_key = bp.video_processor.cache_key(digest)
+    cached_count = 0
+    cached_frames = bp.frame_cache.read(cache_key)
+    try:
+        async for frame in cached_frames:
+            cached_count += 1
+            yield frame
+    finally:
+        await cached_frames.aclose()
+    if cached_count:
+        current_app.logger.info(f"Used {cached_count} cached frames")
+        return
+
+    # Close the extraction as soon as we are closed, so it stops ffmpeg instead of waiting for garbage collection
+    frames = bp.frame_cache.write(cache_key, bp.video_processor.extract_frames(video_path))
+    try:
+        async for frame in frames:
+            yield frame
+    finally:
+        await frames.aclose()
+
+
+async def publish_frames(frames: AsyncIterator[str], blob_prefix: str, blob_names: list[str]) -> AsyncIterator[str]:
+    """
+    Upload frames to blob storage as they arrive, yielding their SAS URLs in frame order.
+
+    The name of every frame blob an upload was started for is appended to blob_names,
+    so a failed request can delete them again.
+    """
+    pending = deque()
+    try:
+        index = 0
+        async for frame in frames:
+            blob_name = f"{blob_prefix}/frame-{index:04d}.jpg"
+            blob_names.append(blob_name)
+            pending.append(asyncio.create_task(bp.blob_storage.upload_frame(blob_name, frame)))
+            index += 1
+            if len(pending) >= FRAME_UPLOAD_CONCURRENCY:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
+        # Let cancelled uploads settle, so deleting their blobs afterwards doesn't race them
+        await asyncio.gather(*pending, return_exceptions=True)
+        await frames.aclose()
+
+
+async def multipart_events() -> AsyncIterator[Event]:
+    """Parse the multipart request body incrementally, as it arrives from the client."""
+    decoder = MultipartDecoder(request.mimetype_params["boundary"].encode())
+    async for data in request.body:
+        decoder.receive_data(data)
+        while not isinstance(event := decoder.next_event(), NeedData):
+            yield event
+    # Raises ValueError if the body ended partway through the form
+    decoder.receive_data(None)
+    while not isinstance(event := decoder.next_event(), NeedData):
+        yield event
+
+
+async def file_data(events: AsyncIterator[Event]) -> AsyncIterator[bytes]:
+    """Yield the data of the file part whose File event was just consumed from events."""
+    async for event in events:
+        if isinstance(event, Data):
+            yield event.data
+            if not event.more_data:
+                return
+    raise ValueError("Upload ended before the file was fully received")
+
+
+def write_block(temp_file, digest, block: bytes):
+    temp_file.write(block)
+    digest.update(block)
+
+
+async def discard_blob_upload(
+    blob_upload: BlobVideoUpload, commit_task: Optional[asyncio.Task], frame_blobs: list[str]
+):
+    """Stop a video upload that failed and delete whatever of it already reached blob storage."""
+    blob_upload.abort()
+    blob_names = list(frame_blobs)
+    if commit_task:
+        commit_task.cancel()
+        # The commit may have finished before the failure, or been sent before it was cancelled
+        await asyncio.gather(commit_task, return_exceptions=True)
+        blob_names.append(blob_upload.blob_client.blob_name)
+    if blob_names:
+        try:
+            await bp.blob_storage.delete_blobs(blob_names)
+        except Exception as e:
+            current_app.logger.warning(f"Failed to delete blobs of failed upload: {e}")
+
+
+def remove_temp_file(path: str):
+    try:
+        Path(path).unlink()
+    except Exception as e:
+        current_app.logger.warning(f"Failed to delete temp file: {e}")
+
+
 @bp.post("/chat/video/upload")
 async def video_upload_handler():
     """
     Handle video upload, extract frames, and store in blob storage.
 
     Returns:
-        JSON with extracted frames and blob URL
+        NDJSON stream with one {"frame": ...} line per extracted frame (a SAS URL when blob
+        storage is configured, otherwise a data URL), followed by a summary line with the
+        frame count and blob URL (or an {"error": ...} line)
     """
+    blob_upload = None
+    commit_task = None
+    frame_blobs = []
+    events = None
     try:
-        files = await request.files
-
-        if 'video' not in files:
+        # Parse the form as it arrives instead of awaiting request.files, which spools the whole body first
+        video_part = None
+        if request.mimetype == "multipart/form-data" and "boundary" in request.mimetype_params:
+            events = multipart_events()
+            async for event in events:
+                if isinstance(event, File) and event.name == "video":
+                    video_part = event
+                    break
+
+        if video_part is None:
             return {"error": "No video file provided"}, 400
 
-        video_file = files['video']
-        filename = secure_filename(video_file.filename)
+        filename = secure_filename(video_part.filename)
 
         # Validate file extension
         file_ext = Path(filename).suffix.lower()
         if file_ext not in ALLOWED_VIDEO_EXTENSIONS:
             return {"error": f"Invalid file type. Only {ALLOWED_VIDEO_EXTENSIONS} allowed"}, 400
 
-        # Read file into memory (with size validation)
-        file_bytes = io.BytesIO()
-        chunk_size = 8192
+        # Start a staged blob upload (if configured) so blocks upload while the video is received
+        if os.getenv("AZURE_STORAGE_ACCOUNT_URL"):
+            blob_upload = await bp.blob_storage.start_video_upload(filename, size=request.content_length)
+
+        # Stream the upload to a temporary file for frame extraction (with size validation)
         total_size = 0
         max_size_bytes = MAX_VIDEO_SIZE_MB * 1024 * 1024
+        digest = hashlib.sha256()
+        temp_file = tempfile.NamedTemporaryFile(suffix=file_ext, delete=False)
+        temp_path = temp_file.name
+        streaming = False
 
-        while True:
-            chunk = await video_file.read(chunk_size)
-            if not chunk:
-                break
-            total_size += len(chunk)
-            if total_size > max_size_bytes:
-                return {"error": f"File too large. Max size: {MAX_VIDEO_SIZE_MB} MB"}, 413
-            file_bytes.write(chunk)
-
-        file_bytes.seek(0)
-        current_app.logger.info(f"Received video: {filename}, size: {total_size / (1024*1024):.2f} MB")
-
-        # Upload to blob storage (if configured)
-        blob_url = None
-        if os.getenv("AZURE_STORAGE_ACCOUNT_URL"):
-            blob_url = await bp.blob_storage.upload_video(file_bytes, filename)
-            file_bytes.seek(0)  # Reset for frame extraction
-
-        # Save to temporary file for frame extraction
-        with tempfile.NamedTemporaryFile(suffix=file_ext, delete=False) as temp_file:
-            temp_file.write(file_bytes.read())
-            temp_path = temp_file.name
+        async def save_block(block: bytes):
+            await asyncio.to_thread(write_block, temp_file, digest, block)
+            if blob_upload:
+                await blob_upload.write(block)
 
         try:
-            # Extract frames
-            frames_base64 = await bp.video_processor.extract_frames(temp_path)
-
-            if not frames_base64:
+            with temp_file:
+                # Gather the small network chunks into larger blocks before writing and hashing them
+                block = bytearray()
+                async for chunk in file_data(events):
+                    total_size += len(chunk)
+                    if total_size > max_size_bytes:
+                        if blob_upload:
+                            await discard_blob_upload(blob_upload, commit_task, frame_blobs)
+                        return {"error": f"File too large. Max size: {MAX_VIDEO_SIZE_MB} MB"}, 413
+                    block += chunk
+                    if len(block) >= RECEIVE_BLOCK_SIZE:
+                        await save_block(block)
+                        block = bytearray()
+                if block:
+                    await save_block(block)
+
+            current_app.logger.info(f"Received video: {filename}, size: {total_size / (1024*1024):.2f} MB")
+
+            # Extract frames while the remaining blob blocks finish uploading
+            commit_task = asyncio.create_task(blob_upload.commit()) if blob_upload else None
+            frames = get_video_frames(temp_path, digest.hexdigest())
+            if blob_upload:
+                # Hand the model frame URLs instead of base64 payloads, so the chat request stays small
+                frames = publish_frames(frames, blob_upload.blob_client.blob_name, frame_blobs)
+
+            # Wait for the first frame so an unreadable video still gets a proper status code
+            try:
+                first_frame = await frames.__anext__()
+            except StopAsyncIteration:
+                first_frame = None
+            if first_frame is None:
+                await frames.aclose()
+                if blob_upload:
+                    await discard_blob_upload(blob_upload, commit_task, frame_blobs)
                 return {"error": "No frames could be extracted from video"}, 422
 
-            return {
-                "success": True,
-                "frames": frames_base64,
-                "frame_count": len(frames_base64),
-                "blob_url": blob_url,
-                "filename": filename
-            }
+            @stream_with_context
+            async def frame_stream():
+                frame_count = 1
+                committed = False
+                try:
+                    yield orjson.dumps({"frame": first_frame}) + b"\n"
+                    async for frame in frames:
+                        frame_count += 1
+                        yield orjson.dumps({"frame": frame}) + b"\n"
+
+                    blob_url = await commit_task if commit_task else None
+                    committed = True
+                    yield orjson.dumps({
+                        "success": True,
+                        "frame_count": frame_count,
+                        "blob_url": blob_url,
+                        "filename": filename
+                    }) + b"\n"
+                except Exception as e:
+                    current_app.logger.error(f"Video upload error: {e}", exc_info=True)
+                    yield orjson.dumps({"error": str(e)}) + b"\n"
+                finally:
+                    # Also reached when the client disconnects mid-stream
+                    await frames.aclose()
+                    if blob_upload and not committed:
+                        await discard_blob_upload(blob_upload, commit_task, frame_blobs)
+                    remove_temp_file(temp_path)
+
+            streaming = True
+            return Response(frame_stream(), content_type="application/x-ndjson")
 
         finally:
-            # Clean up temp file
-            try:
-                Path(temp_path).unlink()
-            except Exception as e:
-                current_app.logger.warning(f"Failed to delete temp file: {e}")
+            # Clean up temp file, unless the frame stream still needs it
+            if not streaming:
+                remove_temp_file(temp_path)
+
+    except RequestEntityTooLarge:
+        # Raised while reading a body whose Content-Length is over MAX_CONTENT_LENGTH
+        if blob_upload:
+            await discard_blob_upload(blob_upload, commit_task, frame_blobs)
+        return {"error": f"File too large. Max size: {MAX_VIDEO_SIZE_MB} MB"}, 413
 
     except Exception as e:
         current_app.logger.error(f"Video upload error: {e}", exc_info=True)
+        if blob_upload:
+            await discard_blob_upload(blob_upload, commit_task, frame_blobs)
         return {"error": str(e)}, 500
 
+    finally:
+        if events:
+            await events.aclose()
+
 
 @bp.post("/chat/stream")
 async def chat_handler():
@@ -181,33 +390,28 @@ async def chat_handler():
     @stream_with_context
     async def response_stream():
         # This sends all messages, so API request may exceed token limits
-        all_messages = [
-            {"role": "system", "content": "You are a helpful assistant."},
-        ] + request_messages[0:-1]
-        all_messages = request_messages[0:-1]
+        all_messages = request_messages[:-1]
 
         if frames:
-            # Handle video frames - send multiple images
-            user_content = [{"text": request_messages[-1]["content"], "type": "text"}]
-
             # Limit frames to avoid token limits (max 10 frames)
             max_frames = int(os.getenv("MAX_FRAMES_PER_REQUEST", "10"))
             selected_frames = frames[:max_frames]
 
-            for idx, frame in enumerate(selected_frames):
-                user_content.append({
-                    "type": "image_url",
-                    "image_url": {"url": frame, "detail": "auto"}
-                })
+            # Handle video frames - send multiple images
+            user_content = [{"text": request_messages[-1]["content"], "type": "text"}] + [
+                {"type": "image_url", "image_url": {"url": frame, "detail": "auto"}}
+                for frame in selected_frames
+            ]
 
             all_messages.append({"role": "user", "content": user_content})
             current_app.logger.info(f"Processing {len(selected_frames)} video frames")
 
         elif image:
             # Handle single image (existing behavior)
-            user_content = []
-            user_content.append({"text": request_messages[-1]["content"], "type": "text"})
-            user_content.append({"image_url": {"url": image, "detail": "auto"}, "type": "image_url"})
+            user_content = [
+                {"text": request_messages[-1]["content"], "type": "text"},
+                {"image_url": {"url": image, "detail": "auto"}, "type": "image_url"},
+            ]
             all_messages.append({"role": "user", "content": user_content})
         else:
             # Text only
@@ -224,9 +428,9 @@ async def chat_handler():
             async for event in await chat_coroutine:
                 event_dict = event.model_dump()
                 if event_dict["choices"]:
-                    yield json.dumps(event_dict["choices"][0], ensure_ascii=False) + "\n"
+                    yield orjson.dumps(event_dict["choices"][0]) + b"\n"
         except Exception as e:
             current_app.logger.error(e)
-            yield json.dumps({"error": str(e)}, ensure_ascii=False) + "\n"
+            yield orjson.dumps({"error": str(e)}) + b"\n"
 
     return Response(response_stream())
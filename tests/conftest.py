@@ -127,11 +127,13 @@ def mock_defaultazurecredential(monkeypatch):
 
 
 @pytest_asyncio.fixture
-async def client(monkeypatch, mock_openai_chatcompletion, mock_defaultazurecredential):
+async def client(monkeypatch, tmp_path, mock_openai_chatcompletion, mock_defaultazurecredential):
     monkeypatch.setenv("OPENAI_HOST", "azure")
     monkeypatch.setenv("AZURE_TENANT_ID", "test-tenant-id")
     monkeypatch.setenv("AZURE_OPENAI_ENDPOINT", "test-openai-service.openai.azure.com")
     monkeypatch.setenv("OPENAI_MODEL", "test-chatgpt")
+    # Keep extracted frames cached per test, so uploads in one test never hit another's cache
+    monkeypatch.setenv("VIDEO_FRAME_CACHE_DIR", str(tmp_path / "frame-cache"))
 
     quart_app = quartapp.create_app()
 
@@ -0,0 +1,104 @@
+import asyncio
+import base64
+from typing import Optional
+
+from azure.storage.blob import UserDelegationKey
+
+from quartapp.video_handler import BlobVideoUpload
+
+
+class MockBlobClient:
+    blob_name = "video.mp4"
+    url = "https://account.blob.core.windows.net/videos/video.mp4"
+
+    def __init__(self, commit_gate: Optional[asyncio.Event] = None):
+        self.blocks = {}
+        self.committed = None
+        # When given, the commit waits until the gate is set
+        self.commit_gate = commit_gate
+        self.commit_done = asyncio.Event()
+
+    async def stage_block(self, block_id, data):
+        # Finish later blocks first, so commit order can't rely on staging order
+        await asyncio.sleep(0.01 / (len(self.blocks) + 1))
+        self.blocks[block_id] = data
+
+    async def commit_block_list(self, block_ids, content_settings):
+        if self.commit_gate:
+            await self.commit_gate.wait()
+        self.committed = (list(block_ids), content_settings.content_type)
+        self.commit_done.set()
+
+
+class MockBlobStorageHandler:
+    def __init__(
+        self,
+        frame_error: Optional[Exception] = None,
+        commit_gate: Optional[asyncio.Event] = None,
+        fail_after_commit: bool = False,
+    ):
+        self.blob_client = MockBlobClient(commit_gate)
+        self.frame_error = frame_error
+        # Hold frame uploads until the video is committed, so a frame failure comes after the commit
+        self.fail_after_commit = fail_after_commit
+        self.frame_uploads = 0
+        self.deleted = []
+
+    async def start_video_upload(self, filename, content_type="video/mp4", size=None):
+        # Small blocks, so test videos are staged as several blocks
+        return BlobVideoUpload(self.blob_client, content_type=content_type, block_size=4096)
+
+    async def upload_frame(self, blob_name, frame):
+        if self.fail_after_commit:
+            await self.blob_client.commit_done.wait()
+        if self.frame_error:
+            raise self.frame_error
+        # Finish later frames first, so URL order can't rely on upload order
+        self.frame_uploads += 1
+        await asyncio.sleep(0.01 / self.frame_uploads)
+        return f"https://account.blob.core.windows.net/videos/{blob_name}?sig=test"
+
+    async def delete_blobs(self, blob_names):
+        self.deleted += blob_names
+
+    async def close(self):
+        pass
+
+
+class MockFrameBlobClient:
+    account_name = "account"
+
+    def __init__(self, container, blob):
+        self.blob_name = blob
+        self.url = f"https://account.blob.core.windows.net/{container}/{blob}"
+        self.uploaded = None
+
+    async def upload_blob(self, data, overwrite, content_settings):
+        self.uploaded = (data, content_settings.content_type)
+
+
+class MockBlobServiceClient:
+    def __init__(self):
+        self.blob_clients = []
+        self.delegation_key_requests = 0
+        self.delegation_key_error: Optional[Exception] = None
+
+    def get_blob_client(self, container, blob):
+        blob_client = MockFrameBlobClient(container, blob)
+        self.blob_clients.append(blob_client)
+        return blob_client
+
+    async def get_user_delegation_key(self, key_start_time, key_expiry_time):
+        self.delegation_key_requests += 1
+        await asyncio.sleep(0)
+        if self.delegation_key_error:
+            raise self.delegation_key_error
+        key = UserDelegationKey()
+        key.signed_oid = "oid"
+        key.signed_tid = "tid"
+        key.signed_start = key_start_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+        key.signed_expiry = key_expiry_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+        key.signed_service = "b"
+        key.signed_version = "2025-01-05"
+        key.value = base64.b64encode(b"delegation-key").decode()
+        return key
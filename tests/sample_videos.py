@@ -0,0 +1,12 @@
+import cv2
+import numpy as np
+
+
+def write_video(video_path, is_flipped, frame_count=30):
+    """Write a 10 fps 320x240 gradient clip, mirroring the gradient on frames where is_flipped(index) is true."""
+    gradient = np.tile(np.linspace(0, 255, 320, dtype=np.uint8)[None, :, None], (240, 1, 3))
+    writer = cv2.VideoWriter(str(video_path), cv2.VideoWriter_fourcc(*"mp4v"), 10, (320, 240))
+    for index in range(frame_count):
+        writer.write(np.ascontiguousarray(gradient[:, ::-1]) if is_flipped(index) else gradient)
+    writer.release()
+    return video_path
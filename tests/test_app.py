@@ -1,11 +1,15 @@
+import asyncio
+import json
 import os
 from unittest import mock
 
 import pytest
+from quart.datastructures import FileStorage
 
 import quartapp
 
-from . import mock_cred
+from . import mock_blob, mock_cred
+from .sample_videos import write_video
 
 
 @pytest.mark.asyncio
@@ -48,6 +52,56 @@ async def test_chat_stream_text_history(client, snapshot):
     snapshot.assert_match(result, "result.json")
 
 
+async def mock_completion_chunks():
+    return
+    yield
+
+
+FRAME_URLS = [f"https://account.blob.core.windows.net/videos/frame-{index:04d}.jpg" for index in range(12)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "context, images",
+    [
+        # Only the first MAX_FRAMES_PER_REQUEST (10) frames are sent
+        ({"frames": FRAME_URLS}, FRAME_URLS[:10]),
+        ({"file": "data:image/png;base64,AAAA"}, ["data:image/png;base64,AAAA"]),
+    ],
+)
+async def test_chat_stream_images(client, monkeypatch, context, images):
+    requests = []
+
+    async def mock_acreate(*args, **kwargs):
+        requests.append(kwargs)
+        return mock_completion_chunks()
+
+    monkeypatch.setattr("openai.resources.chat.AsyncCompletions.create", mock_acreate)
+    response = await client.post(
+        "/chat/stream",
+        json={
+            "messages": [
+                {"role": "user", "content": "Hi"},
+                {"role": "assistant", "content": "Hello"},
+                {"role": "user", "content": "What is in this video?"},
+            ],
+            "context": context,
+        },
+    )
+    assert response.status_code == 200
+    await response.get_data()
+
+    assert requests[0]["messages"] == [
+        {"role": "user", "content": "Hi"},
+        {"role": "assistant", "content": "Hello"},
+        {
+            "role": "user",
+            "content": [{"text": "What is in this video?", "type": "text"}]
+            + [{"type": "image_url", "image_url": {"url": image, "detail": "auto"}} for image in images],
+        },
+    ]
+
+
 @pytest.mark.asyncio
 async def test_openai_key(monkeypatch):
     quart_app = quartapp.create_app()
@@ -89,3 +143,162 @@ async def test_openai_local(monkeypatch):
         async with quart_app.test_app():
             assert quart_app.blueprints["chat"].openai_client.api_key == "no-key-required"
             assert quart_app.blueprints["chat"].openai_client.base_url == "http://localhost:8080"
+
+
+@pytest.fixture
+def sample_video(tmp_path):
+    # One cut halfway through the 3 second clip, where the gradient flips direction
+    return write_video(tmp_path / "sample.mp4", lambda index: index >= 15)
+
+
+@pytest.fixture
+def static_video(tmp_path):
+    return write_video(tmp_path / "static.mp4", lambda index: False)
+
+
+@pytest.mark.asyncio
+async def test_video_upload(client, sample_video, monkeypatch):
+    # Receive the video in several blocks
+    monkeypatch.setattr(quartapp.chat, "RECEIVE_BLOCK_SIZE", 4096)
+    response = await client.post(
+        "/chat/video/upload",
+        files={"video": FileStorage(sample_video.open("rb"), filename="sample.mp4")},
+    )
+    assert response.status_code == 200
+    events = [json.loads(line) for line in (await response.get_data()).splitlines()]
+    frames = [event["frame"] for event in events[:-1]]
+    assert len(frames) == 2
+    assert all(frame.startswith("data:image/jpeg;base64,") for frame in frames)
+    assert events[-1] == {"success": True, "frame_count": 2, "blob_url": None, "filename": "sample.mp4"}
+
+
+@pytest.mark.asyncio
+async def test_video_upload_reuses_cached_frames(client, sample_video, monkeypatch):
+    video_processor = quartapp.chat.bp.video_processor
+    extract_frames = video_processor.extract_frames
+    extracted = []
+
+    def counting_extract_frames(video_path):
+        extracted.append(video_path)
+        return extract_frames(video_path)
+
+    monkeypatch.setattr(video_processor, "extract_frames", counting_extract_frames)
+
+    results = []
+    for _ in range(2):
+        response = await client.post(
+            "/chat/video/upload",
+            files={"video": FileStorage(sample_video.open("rb"), filename="sample.mp4")},
+        )
+        assert response.status_code == 200
+        results.append([json.loads(line) for line in (await response.get_data()).splitlines()])
+
+    # The second upload of the same bytes is served from the cache
+    assert len(extracted) == 1
+    assert results[1] == results[0]
+    assert results[0][-1]["frame_count"] == 2
+
+
+@pytest.mark.asyncio
+async def test_video_upload_missing_file(client):
+    response = await client.post("/chat/video/upload", form={"other": "value"})
+    assert response.status_code == 400
+    assert (await response.get_json()) == {"error": "No video file provided"}
+
+
+@pytest.mark.asyncio
+async def test_video_upload_invalid_extension(client, sample_video):
+    response = await client.post(
+        "/chat/video/upload",
+        files={"video": FileStorage(sample_video.open("rb"), filename="sample.avi")},
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_video_upload_over_16_mib_reaches_size_limit(client, tmp_path, monkeypatch):
+    # Larger than Quart's default MAX_CONTENT_LENGTH, so the handler's own limit must be what rejects it
+    monkeypatch.setattr(quartapp.chat, "MAX_VIDEO_SIZE_MB", 16)
+    video_path = tmp_path / "large.mp4"
+    video_path.write_bytes(bytes(17 * 1024 * 1024))
+    response = await client.post(
+        "/chat/video/upload",
+        files={"video": FileStorage(video_path.open("rb"), filename="large.mp4")},
+    )
+    assert response.status_code == 413
+    assert (await response.get_json()) == {"error": "File too large. Max size: 16 MB"}
+
+
+@pytest.mark.asyncio
+async def test_video_upload_over_max_content_length(client, sample_video):
+    client.app.config["MAX_CONTENT_LENGTH"] = 1024
+    response = await client.post(
+        "/chat/video/upload",
+        files={"video": FileStorage(sample_video.open("rb"), filename="sample.mp4")},
+    )
+    assert response.status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_video_upload_skips_static_frames(client, static_video):
+    response = await client.post(
+        "/chat/video/upload",
+        files={"video": FileStorage(static_video.open("rb"), filename="static.mp4")},
+    )
+    assert response.status_code == 200
+    events = [json.loads(line) for line in (await response.get_data()).splitlines()]
+    assert events[-1]["frame_count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_video_upload_to_blob_storage(client, sample_video, monkeypatch):
+    blob_storage = mock_blob.MockBlobStorageHandler()
+    monkeypatch.setattr(quartapp.chat.bp, "blob_storage", blob_storage)
+    monkeypatch.setenv("AZURE_STORAGE_ACCOUNT_URL", "https://account.blob.core.windows.net")
+
+    response = await client.post(
+        "/chat/video/upload",
+        files={"video": FileStorage(sample_video.open("rb"), filename="sample.mp4")},
+    )
+    assert response.status_code == 200
+    events = [json.loads(line) for line in (await response.get_data()).splitlines()]
+    # Frame URLs come back in frame order, even though the later upload finished first
+    assert [event["frame"] for event in events[:-1]] == [
+        "https://account.blob.core.windows.net/videos/video.mp4/frame-0000.jpg?sig=test",
+        "https://account.blob.core.windows.net/videos/video.mp4/frame-0001.jpg?sig=test",
+    ]
+    assert events[-1] == {
+        "success": True,
+        "frame_count": 2,
+        "blob_url": "https://account.blob.core.windows.net/videos/video.mp4",
+        "filename": "sample.mp4",
+    }
+
+    blob_client = blob_storage.blob_client
+    block_ids, content_type = blob_client.committed
+    assert content_type == "video/mp4"
+    assert len(block_ids) > 1
+    assert b"".join(blob_client.blocks[block_id] for block_id in block_ids) == sample_video.read_bytes()
+    assert blob_storage.deleted == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("commit_first", [False, True])
+async def test_video_upload_failure_discards_blobs(client, sample_video, monkeypatch, commit_first):
+    # Either hold the commit until after the failure, or fail frame uploads only once it's done
+    blob_storage = mock_blob.MockBlobStorageHandler(
+        frame_error=RuntimeError("frame upload failed"),
+        commit_gate=None if commit_first else asyncio.Event(),
+        fail_after_commit=commit_first,
+    )
+    monkeypatch.setattr(quartapp.chat.bp, "blob_storage", blob_storage)
+    monkeypatch.setenv("AZURE_STORAGE_ACCOUNT_URL", "https://account.blob.core.windows.net")
+
+    response = await client.post(
+        "/chat/video/upload",
+        files={"video": FileStorage(sample_video.open("rb"), filename="sample.mp4")},
+    )
+    assert response.status_code == 500
+    assert (await response.get_json()) == {"error": "frame upload failed"}
+    assert (blob_storage.blob_client.committed is not None) is commit_first
+    assert blob_storage.deleted == ["video.mp4/frame-0000.jpg", "video.mp4/frame-0001.jpg", "video.mp4"]
@@ -0,0 +1,376 @@
+import asyncio
+import base64
+import os
+import shutil
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlsplit
+
+import cv2
+import numpy as np
+import pytest
+
+from quartapp.video_handler import (
+    FRAME_QUEUE_SIZE,
+    AzureBlobStorageHandler,
+    BlobVideoUpload,
+    FrameCache,
+    VideoProcessor,
+)
+
+from .mock_blob import MockBlobClient, MockBlobServiceClient
+from .sample_videos import write_video
+
+
+async def frames_from(items):
+    for item in items:
+        yield item
+
+
+async def collect(frames):
+    return [frame async for frame in frames]
+
+
+@pytest.mark.asyncio
+async def test_frame_cache_roundtrip(tmp_path):
+    cache = FrameCache(str(tmp_path))
+    assert await collect(cache.read("abc_1.0_768")) == []
+
+    written = await collect(cache.write("abc_1.0_768", frames_from(["data:image/jpeg;base64,AAAA", "data:,B"])))
+    assert written == ["data:image/jpeg;base64,AAAA", "data:,B"]
+    assert await collect(cache.read("abc_1.0_768")) == ["data:image/jpeg;base64,AAAA", "data:,B"]
+
+
+@pytest.mark.asyncio
+async def test_frame_cache_skips_partial_writes(tmp_path):
+    cache = FrameCache(str(tmp_path))
+    frames = cache.write("abc", frames_from(["1", "2", "3"]))
+    assert await frames.__anext__() == "1"
+    await frames.aclose()
+
+    assert await collect(cache.read("abc")) == []
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.asyncio
+async def test_frame_cache_write_closes_wrapped_frames(tmp_path):
+    closed = []
+
+    async def frames():
+        try:
+            yield "1"
+            yield "2"
+        finally:
+            closed.append(True)
+
+    cached = FrameCache(str(tmp_path)).write("abc", frames())
+    assert await cached.__anext__() == "1"
+    await cached.aclose()
+
+    assert closed == [True]
+
+
+@pytest.mark.asyncio
+async def test_frame_cache_evicts_least_recently_used(tmp_path):
+    # Room for two of the two-byte entries
+    cache = FrameCache(str(tmp_path), max_bytes=4)
+    await collect(cache.write("first", frames_from(["1"])))
+    await collect(cache.write("second", frames_from(["2"])))
+    os.utime(tmp_path / "first.frames", (1000, 1000))
+    os.utime(tmp_path / "second.frames", (2000, 2000))
+    # Reading an entry marks it as recently used, so "second" is evicted instead
+    assert await collect(cache.read("first")) == ["1"]
+    await collect(cache.write("third", frames_from(["3"])))
+
+    assert sorted(entry.name for entry in tmp_path.glob("*.frames")) == ["first.frames", "third.frames"]
+
+
+@pytest.mark.asyncio
+async def test_frame_cache_evicts_entry_larger_than_limit(tmp_path):
+    cache = FrameCache(str(tmp_path), max_bytes=4)
+    await collect(cache.write("small", frames_from(["1"])))
+    assert await collect(cache.write("large", frames_from(["12345"]))) == ["12345"]
+
+    assert sorted(entry.name for entry in tmp_path.glob("*.frames")) == ["small.frames"]
+
+
+@pytest.mark.asyncio
+async def test_frame_cache_disabled(tmp_path):
+    cache = FrameCache(str(tmp_path), max_bytes=0)
+    assert await collect(cache.write("abc", frames_from(["1"]))) == ["1"]
+    assert await collect(cache.read("abc")) == []
+    assert not list(tmp_path.iterdir())
+
+
+def python_command(code):
+    return [sys.executable, "-c", code]
+
+
+def test_ffmpeg_process_drains_large_error_output():
+    # More error output than a pipe buffer holds, written before any frame data
+    command = python_command("import sys; sys.stderr.write('x' * 200000); sys.stdout.write('frames')")
+    with VideoProcessor._ffmpeg_process(command) as process:
+        assert process.stdout.read() == b"frames"
+
+
+def test_ffmpeg_process_reports_tail_of_errors():
+    command = python_command("import sys; sys.stderr.write('x' * 200000 + 'invalid NAL unit'); sys.exit(1)")
+    with pytest.raises(ValueError, match="invalid NAL unit") as exc_info:
+        with VideoProcessor._ffmpeg_process(command) as process:
+            process.stdout.read()
+    assert len(str(exc_info.value)) < 5000
+
+
+@pytest.mark.asyncio
+async def test_extract_frames_stops_producer_when_closed_early(monkeypatch):
+    produced = []
+    closed = threading.Event()
+
+    def frames(video_path):
+        try:
+            # More frames than the queue holds, so the producer blocks on it
+            for index in range(FRAME_QUEUE_SIZE * 4):
+                produced.append(index)
+                yield str(index)
+        finally:
+            closed.set()
+
+    processor = VideoProcessor()
+    monkeypatch.setattr(processor, "_extract_frames_sync", frames)
+    extraction = processor.extract_frames("video.mp4")
+    assert await extraction.__anext__() == "0"
+    await extraction.aclose()
+
+    assert closed.is_set()
+    assert len(produced) < FRAME_QUEUE_SIZE * 4
+
+
+@pytest.mark.asyncio
+async def test_extract_frames_raises_extraction_errors(tmp_path):
+    video_path = tmp_path / "corrupt.mp4"
+    video_path.write_bytes(b"not a video" * 1000)
+
+    with pytest.raises(ValueError):
+        await collect(VideoProcessor(hwaccel="none").extract_frames(str(video_path)))
+
+
+class ChunkedStream:
+    """Stand-in for ffmpeg's stdout that returns the given chunks one read at a time."""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def read(self, size=-1):
+        return self.chunks.pop(0) if self.chunks else b""
+
+
+def test_run_ffmpeg_keeps_marker_split_across_reads(monkeypatch):
+    jpegs = [cv2.imencode(".jpg", np.full((16, 16, 3), value, np.uint8))[1].tobytes() for value in (0, 120, 240)]
+    stream = b"".join(jpegs)
+    # The second frame's SOI marker straddles two reads
+    split = len(jpegs[0]) + 1
+
+    @contextmanager
+    def fake_process(command):
+        yield SimpleNamespace(stdout=ChunkedStream([stream[:split], stream[split:]]))
+
+    monkeypatch.setattr(VideoProcessor, "_ffmpeg_process", staticmethod(fake_process))
+    frames = list(VideoProcessor(dedup_distance=-1)._run_ffmpeg([]))
+
+    assert [base64.b64decode(frame.split(",", 1)[1]) for frame in frames] == jpegs
+
+
+@pytest.mark.parametrize("seek_min_gap", [0, 10, 1000])
+def test_read_frames_seek_returns_target_frames(tmp_path, monkeypatch, seek_min_gap):
+    monkeypatch.setattr("quartapp.video_handler.SEEK_MIN_GAP_FRAMES", seek_min_gap)
+    video_path = str(tmp_path / "counter.mp4")
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*"mp4v"), 10, (64, 64))
+    for index in range(40):
+        # Each frame's brightness encodes its index
+        writer.write(np.full((64, 64, 3), index * 6, np.uint8))
+    writer.release()
+
+    cap = cv2.VideoCapture(video_path)
+    try:
+        frames = list(VideoProcessor()._read_frames_seek(cap, [0, 3, 30, 35]))
+    finally:
+        cap.release()
+
+    assert [round(frame.mean() / 6) for frame in frames] == [0, 3, 30, 35]
+
+
+@pytest.mark.parametrize(
+    "backend",
+    [
+        pytest.param("ffmpeg", marks=pytest.mark.skipif(not shutil.which("ffmpeg"), reason="ffmpeg not installed")),
+        "opencv",
+    ],
+)
+def test_extract_frames_downscales_to_max_dimension(tmp_path, backend):
+    video_path = str(tmp_path / "large.mp4")
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*"mp4v"), 10, (1280, 720))
+    for _ in range(10):
+        writer.write(np.full((720, 1280, 3), 128, np.uint8))
+    writer.release()
+
+    processor = VideoProcessor(hwaccel="none", max_dimension=768)
+    extract = processor._extract_frames_ffmpeg if backend == "ffmpeg" else processor._extract_frames_opencv
+    frames = list(extract(video_path))
+
+    assert frames
+    for frame in frames:
+        jpeg = np.frombuffer(base64.b64decode(frame.split(",", 1)[1]), np.uint8)
+        assert cv2.imdecode(jpeg, cv2.IMREAD_COLOR).shape[:2] == (432, 768)
+
+
+@pytest.mark.parametrize(
+    "backend",
+    [
+        pytest.param("ffmpeg", marks=pytest.mark.skipif(not shutil.which("ffmpeg"), reason="ffmpeg not installed")),
+        "opencv",
+    ],
+)
+def test_extract_frames_samples_final_partial_second(tmp_path, backend):
+    video_path = str(tmp_path / "partial.mp4")
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*"mp4v"), 10, (64, 64))
+    # 2.5 seconds, so the last sample falls in the final half second
+    for index in range(25):
+        writer.write(np.full((64, 64, 3), index * 10, np.uint8))
+    writer.release()
+
+    processor = VideoProcessor(hwaccel="none", scene_threshold=0, dedup_distance=-1)
+    extract = processor._extract_frames_ffmpeg if backend == "ffmpeg" else processor._extract_frames_opencv
+    assert len(list(extract(video_path))) == 3
+
+
+def test_is_duplicate_drops_near_duplicates_only():
+    processor = VideoProcessor(dedup_distance=4)
+    gradient = np.tile(np.linspace(0, 200, 64, dtype=np.uint8), (48, 1))
+    seen_hashes = []
+
+    assert not processor._is_duplicate(gradient, seen_hashes)
+    # A brightness shift keeps the neighbour comparisons, so it hashes the same
+    assert processor._is_duplicate(gradient + 20, seen_hashes)
+    assert not processor._is_duplicate(np.ascontiguousarray(gradient[:, ::-1]), seen_hashes)
+    assert len(seen_hashes) == 2
+
+
+@pytest.mark.parametrize(
+    "backend",
+    [
+        pytest.param("ffmpeg", marks=pytest.mark.skipif(not shutil.which("ffmpeg"), reason="ffmpeg not installed")),
+        "opencv",
+    ],
+)
+def test_extract_frames_drops_repeated_scenes(tmp_path, backend):
+    # One second each of A, B, then A again
+    video_path = str(write_video(tmp_path / "repeat.mp4", lambda index: 10 <= index < 20))
+
+    # Without the scene filter every sampled frame reaches the dHash filter
+    processor = VideoProcessor(hwaccel="none", scene_threshold=0, dedup_distance=4)
+    extract = processor._extract_frames_ffmpeg if backend == "ffmpeg" else processor._extract_frames_opencv
+    frames = [
+        cv2.imdecode(np.frombuffer(base64.b64decode(frame.split(",", 1)[1]), np.uint8), cv2.IMREAD_GRAYSCALE)
+        for frame in extract(video_path)
+    ]
+
+    assert len(frames) == 2
+    # The kept frames are A then B: brightness rises left to right in A and falls in B
+    assert frames[0][:, 0].mean() < frames[0][:, -1].mean()
+    assert frames[1][:, 0].mean() > frames[1][:, -1].mean()
+
+
+@pytest.mark.asyncio
+async def test_blob_video_upload_stages_blocks_in_order():
+    blob_client = MockBlobClient()
+    upload = BlobVideoUpload(blob_client, block_size=4, max_concurrency=2)
+    for chunk in (b"abc", b"defgh", b"ij"):
+        await upload.write(chunk)
+
+    assert await upload.commit() == blob_client.url
+    block_ids, content_type = blob_client.committed
+    assert content_type == "video/mp4"
+    assert [base64.b64decode(block_id) for block_id in block_ids] == [b"00000000", b"00000001", b"00000002"]
+    # Full blocks first, then the tail block with whatever was left over
+    assert [blob_client.blocks[block_id] for block_id in block_ids] == [b"abcd", b"efgh", b"ij"]
+
+
+@pytest.mark.asyncio
+async def test_upload_frame_returns_read_only_sas_url():
+    handler = AzureBlobStorageHandler()
+    handler.blob_service_client = MockBlobServiceClient()
+    frame = "data:image/jpeg;base64," + base64.b64encode(b"jpeg").decode()
+
+    urls = await asyncio.gather(*(handler.upload_frame(f"video.mp4/frame-{i:04d}.jpg", frame) for i in range(3)))
+
+    # Concurrent uploads share a single delegation key
+    assert handler.blob_service_client.delegation_key_requests == 1
+    for index, url in enumerate(urls):
+        parts = urlsplit(url)
+        assert parts.path == f"/videos/video.mp4/frame-{index:04d}.jpg"
+        query = parse_qs(parts.query)
+        assert query["sp"] == ["r"]
+        assert query["sig"]
+    assert [blob_client.uploaded for blob_client in handler.blob_service_client.blob_clients] == [
+        (b"jpeg", "image/jpeg")
+    ] * 3
+
+
+@pytest.mark.asyncio
+async def test_user_delegation_key_refresh_failure_is_retried():
+    handler = AzureBlobStorageHandler()
+    handler.blob_service_client = MockBlobServiceClient()
+    now = datetime.now(timezone.utc)
+    await handler._user_delegation_key(now)
+
+    # Past the point where SAS tokens would outlive the cached key
+    later = now + timedelta(days=1, hours=1)
+    expiry = handler._delegation_key_expiry
+    handler.blob_service_client.delegation_key_error = RuntimeError("token expired")
+    with pytest.raises(RuntimeError):
+        await handler._user_delegation_key(later)
+    assert handler._delegation_key_expiry == expiry
+
+    handler.blob_service_client.delegation_key_error = None
+    await handler._user_delegation_key(later)
+    assert handler.blob_service_client.delegation_key_requests == 3
+    assert handler._delegation_key_expiry == later + timedelta(days=2)
+
+
+@pytest.mark.parametrize("has_device", [False, True])
+def test_detect_cuda_requires_a_device(monkeypatch, has_device):
+    # Distro ffmpeg builds list cuda among their hwaccels whether or not the host has a GPU
+    monkeypatch.setattr("quartapp.video_handler.shutil.which", lambda name: "/usr/bin/ffmpeg")
+    monkeypatch.setattr(VideoProcessor, "_probe_ffmpeg", staticmethod(lambda option: "vdpau cuda scale_cuda"))
+    monkeypatch.setattr(VideoProcessor, "_probe_cuda_device", staticmethod(lambda: has_device))
+
+    assert VideoProcessor(hwaccel="auto").cuda_enabled is has_device
+
+
+def test_detect_cuda_raises_when_required_but_unavailable(monkeypatch):
+    monkeypatch.setattr("quartapp.video_handler.shutil.which", lambda name: "/usr/bin/ffmpeg")
+    monkeypatch.setattr(VideoProcessor, "_probe_ffmpeg", staticmethod(lambda option: "vdpau cuda scale_cuda"))
+    monkeypatch.setattr(VideoProcessor, "_probe_cuda_device", staticmethod(lambda: False))
+
+    with pytest.raises(ValueError, match="could not open a CUDA device"):
+        VideoProcessor(hwaccel="cuda")
+
+
+def test_cuda_extraction_retries_on_cpu_before_first_frame(monkeypatch):
+    commands = []
+
+    def run_ffmpeg(command):
+        commands.append(command)
+        if "cuda" in command:
+            raise RuntimeError("CUDA out of memory")
+        yield "data:image/jpeg;base64,AAAA"
+
+    processor = VideoProcessor(hwaccel="none")
+    processor.cuda_enabled = True
+    monkeypatch.setattr(processor, "_run_ffmpeg", run_ffmpeg)
+
+    assert list(processor._extract_frames_ffmpeg("video.mp4")) == ["data:image/jpeg;base64,AAAA"]
+    assert ["cuda" in command for command in commands] == [True, False]